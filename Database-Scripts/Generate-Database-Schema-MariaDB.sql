@@ -690,15 +690,15 @@ ON DUPLICATE KEY UPDATE exoValue = '2.0.0';
 CREATE FUNCTION num_tasks_with_active_rate_limit ()
 -- Number of tasks in the queue that do not yield a permanent error,
 -- but are currently affected by a rate limit.
+-- Tasks without any error count as well: "causesError NOT IN (...)"
+-- would be NULL for them and drop them.
 RETURNS INTEGER
 RETURN(
-    SELECT COUNT(*) FROM queue
-    WHERE causesError NOT IN (
-        SELECT id FROM errorType
-        WHERE permanent = 1)
-    AND fqdnhash IN (
-        SELECT fqdnhash FROM rateLimits
-        WHERE noContactUntil > NOW())
+    SELECT COUNT(*) FROM queue AS q
+    JOIN rateLimits AS rl ON rl.fqdnHash = q.fqdnHash
+        AND rl.noContactUntil > NOW()
+    LEFT JOIN errorType AS e ON e.id = q.causesError
+    WHERE COALESCE(e.permanent, 0) = 0
     );
 
 
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared fixtures for the automatic tests of exoskeleton
+~~~~~~~~~~~~~~~~~~~~~
+Source: https://github.com/RuedigerVoigt/exoskeleton
+(c) 2019-2021 Rüdiger Voigt
+Released under the Apache License 2.0
+"""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+
+@pytest.fixture
+def mock_db() -> MagicMock:
+    "Stands in for a DatabaseConnection object."
+    return MagicMock()
+
+
+@pytest.fixture
+def cursor(mock_db: MagicMock) -> MagicMock:
+    "The cursor the managers get from mock_db.get_cursor()."
+    return mock_db.get_cursor.return_value
+
+
+@pytest.fixture
+def action_objects(mock_db: MagicMock) -> dict:
+    """The objects dictionary ExoActions hands to the classes that get
+       an object, with mock_db as the database connection."""
+    objects = {key: MagicMock() for key in (
+        'stats_manager_object', 'file_manager_object',
+        'time_manager_object', 'crawling_error_manager_object',
+        'session', 'connection_timeout')}
+    objects['db_connection'] = mock_db
+    return objects
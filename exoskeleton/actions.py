@@ -10,6 +10,7 @@ Source: https://github.com/RuedigerVoigt/exoskeleton
 Released under the Apache License 2.0
 """
 # standard library:
+import http.cookiejar
 import logging
 from typing import Final, Literal
 
@@ -58,7 +59,7 @@ class GetObjectBaseClass:
         self.file = objects['file_manager_object']
         self.time = objects['time_manager_object']
         self.errorhandling = objects['crawling_error_manager_object']
-        self.user_agent = objects['user_agent']
+        self.session: requests.Session = objects['session']
         self.connection_timeout = objects['connection_timeout']
         self.queue_id = queue_id
         self.url = url
@@ -70,6 +71,8 @@ class GetObjectBaseClass:
 
     def get_the_object(self) -> None:
         "Get the object and handle exceptions that might occur"
+        # Each outcome updates the host statistics exactly once:
+        log_outcome = self.stats.log_successful_request
         try:
             response = self.handle_action()
             status_code = response.status_code
@@ -81,22 +84,25 @@ class GetObjectBaseClass:
                 self.store_result(response)
             elif status_code in self.HTTP_PERMANENT_ERRORS:
                 self.errorhandling.mark_permanent_error(self.queue_id, status_code)
-                self.stats.log_permanent_error(self.url)
+                log_outcome = self.stats.log_permanent_error
             elif status_code == 429:
                 # The server tells explicity that the bot hit a rate limit!
                 logging.error('The bot hit a rate limit => increase min_wait.')
                 self.errorhandling.add_rate_limit(self.url.hostname)
-                self.stats.log_rate_limit_hit(self.url)
+                log_outcome = self.stats.log_rate_limit_hit
             elif status_code in self.HTTP_TEMP_ERRORS:
                 logging.info('Temporary error. Adding delay to queue item.')
                 self.errorhandling.add_crawl_delay(self.queue_id, status_code)
+                log_outcome = self.stats.log_temporary_problem
             else:
                 logging.error('Unhandled return code %s', status_code)
-                self.stats.log_permanent_error(self.url)
+                log_outcome = self.stats.log_permanent_error
+            if status_code != 200:
+                self.discard_body(response)
         except TimeoutError:
             logging.error('Reached timeout.', exc_info=True)
             self.errorhandling.add_crawl_delay(self.queue_id, 4)
-            self.stats.log_temporary_problem(self.url)
+            log_outcome = self.stats.log_temporary_problem
 
         except ConnectionError:
             logging.error('Connection Error', exc_info=True)
@@ -106,8 +112,8 @@ class GetObjectBaseClass:
         except urllib3.exceptions.NewConnectionError:
             logging.error('New Connection Error: might be a rate limit',
                           exc_info=True)
-            self.stats.log_rate_limit_hit(self.url)
             self.time.increase_wait()
+            log_outcome = self.stats.log_rate_limit_hit
 
         except Exception:
             logging.error('Unknown exception while trying to download.',
@@ -115,7 +121,18 @@ class GetObjectBaseClass:
             self.stats.log_permanent_error(self.url)
             raise
         self.stats.increment_processed_counter()
-        self.stats.log_successful_request(self.url)
+        log_outcome(self.url)
+
+    @staticmethod
+    def discard_body(response: requests.Response) -> None:
+        """The body of an error is not needed. Read it anyway and close the
+           response, so a streamed connection goes back to the pool of the
+           session instead of staying open."""
+        try:
+            _ = response.content
+        except requests.exceptions.RequestException:
+            pass
+        response.close()
 
     def handle_action(self) -> requests.Response:
         "Do the actual request"
@@ -132,9 +149,8 @@ class GetFile(GetObjectBaseClass):
     "Download a file"
     def handle_action(self) -> requests.Response:
         logging.debug('starting download of queue id %s', self.queue_id)
-        response = requests.get(
+        response = self.session.get(
             str(self.url),
-            headers={"User-agent": self.user_agent},
             timeout=self.connection_timeout,
             stream=True)
         return response
@@ -145,20 +161,22 @@ class GetFile(GetObjectBaseClass):
         extension = userprovided.url.determine_file_extension(
             str(self.url), self.mime_type)
         new_filename = f"{self.file.file_prefix}{self.queue_id}{extension}"
-        file_path = self.file.write_response_to_file(
+        _, hash_value, file_size = self.file.write_response_to_file(
             response, new_filename)
-        hash_value = self.file.get_file_hash(file_path)
 
         try:
-            self.cur.callproc('insert_file_SP',
-                              (self.url, self.url.hash,
-                               self.queue_id,
-                               self.mime_type,
-                               str(self.file.target_dir),
-                               new_filename,
-                               self.file.get_file_size(file_path),
-                               self.file.HASH_METHOD,
-                               hash_value, 1))
+            # execute instead of callproc: callproc needs an additional
+            # round trip to set the parameters as user variables.
+            self.cur.execute('CALL insert_file_SP(' +
+                             '%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);',
+                             (self.url, self.url.hash,
+                              self.queue_id,
+                              self.mime_type,
+                              self.file.target_dir_str,
+                              new_filename,
+                              file_size,
+                              self.file.HASH_METHOD,
+                              hash_value, 1))
         except pymysql.DatabaseError:
             logging.error(
                 'Did not add already downloaded file %s to the database!',
@@ -167,11 +185,16 @@ class GetFile(GetObjectBaseClass):
 
 class GetContent(GetObjectBaseClass):
     "Get a page's content including the HTML code"
+
+    # Content of these types is stored as it is, even if only the text
+    # is requested, because it cannot contain HTML code:
+    NO_MARKUP_MIME_TYPES: Final = ('application/json', 'text/csv',
+                                   'text/plain')
+
     def handle_action(self) -> requests.Response:
         logging.debug('retrieving content of queue id %s', self.queue_id)
-        response = requests.get(
+        response = self.session.get(
             str(self.url),
-            headers={"User-agent": self.user_agent},
             timeout=self.connection_timeout,
             stream=False)
         return response
@@ -179,25 +202,44 @@ class GetContent(GetObjectBaseClass):
     def store_result(self,
                      response: requests.Response,
                      strip_code: bool = False) -> None:
-        detected_encoding = str(response.encoding)
-        logging.debug('detected encoding: %s', detected_encoding)
-        page_content = response.text
+        page_content = self.decode_content(response)
         if self.mime_type == 'text/html' and self.prettify_html:
             page_content = helpers.prettify_html(page_content)
-        if strip_code:
+        if strip_code and self.mime_type not in self.NO_MARKUP_MIME_TYPES:
+            # Parsing is only needed if there can be code to remove:
             page_content = helpers.strip_code(page_content)
 
         try:
             # Stored procedure saves the content, transfers the
             # labels from the queue, and removes the queue item:
-            self.cur.callproc('insert_content_SP',
-                              (self.url, self.url.hash, self.queue_id,
-                               self.mime_type, page_content, 2))
+            self.cur.execute('CALL insert_content_SP(' +
+                             '%s, %s, %s, %s, %s, %s);',
+                             (self.url, self.url.hash, self.queue_id,
+                              self.mime_type, page_content, 2))
         except pymysql.DatabaseError:
             logging.error(
                 'Transaction failed: Can not save page code of queue item %s!',
                 self.queue_id, exc_info=True)
 
+    @staticmethod
+    def decode_content(response: requests.Response) -> str:
+        """Decode the body of the response to a string.
+           If the server states no charset, requests assumes ISO-8859-1
+           for any text/* type and runs a character set detection over the
+           whole body for all others. As most pages are UTF-8 encoded
+           anyway, try that first."""
+        content_type = response.headers.get('content-type', '')
+        if 'charset' not in content_type.lower():
+            try:
+                page_content = response.content.decode('utf-8')
+                logging.debug('no charset stated: decoded as UTF-8')
+                return page_content
+            except UnicodeDecodeError:
+                logging.debug('no charset stated and not UTF-8')
+        else:
+            logging.debug('stated encoding: %s', response.encoding)
+        return response.text
+
 
 class GetText(GetContent):
     "Get the text on a page without the code."
@@ -237,13 +279,14 @@ class GetPDF():
 
     def store_result(self) -> None:
         "Store the PDF info in the database"
+        hash_value, file_size = self.file.get_file_hash_and_size(self.path)
         try:
-            self.cur.callproc(
-                'insert_file_SP',
+            self.cur.execute(
+                'CALL insert_file_SP(' +
+                '%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);',
                 (self.url, self.url.hash, self.queue_id, 'application/pdf',
-                 str(self.file.target_dir), self.filename,
-                 self.file.get_file_size(self.path),
-                 self.file.HASH_METHOD, self.file.get_file_hash(self.path), 3))
+                 self.file.target_dir_str, self.filename, file_size,
+                 self.file.HASH_METHOD, hash_value, 3))
         except pymysql.DatabaseError:
             logging.error(
                 'Transaction failed: Could not add file %s to the database!',
@@ -272,13 +315,25 @@ class ExoActions:
         self.stats = stats_manager_object
         self.user_agent = user_agent
         self.connection_timeout = connection_timeout
+        # A single session keeps connections alive, so consecutive requests
+        # to the same host do not need a new TCP and TLS handshake.
+        # The User-Agent header is set once for all requests.
+        # The default adapters are sufficient: a single worker needs one
+        # connection per host and they do not retry on their own, which is
+        # left to the queue (see CrawlingErrorManager).
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = str(self.user_agent)
+        # Unlike separate calls of requests.get, a session would store
+        # cookies and send them back. Accept cookies from no domain:
+        self.session.cookies.set_policy(
+            http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
         self.objects = {
             'db_connection': self.db_connection,
             'stats_manager_object': self.stats,
             'file_manager_object': file_manager_object,
             'time_manager_object': time_manager_object,
             'crawling_error_manager_object': crawling_error_manager_object,
-            'user_agent': self.user_agent,
+            'session': self.session,
             'connection_timeout': self.connection_timeout,
             'controlled_browser': remote_control_chrome_object
         }
@@ -308,9 +363,8 @@ class ExoActions:
             raise ValueError('Missing URL')
 
         try:
-            response = requests.get(
+            response = self.session.get(
                 str(url),
-                headers={"User-agent": str(self.user_agent)},
                 timeout=self.connection_timeout,
                 stream=False)
 
@@ -54,18 +54,18 @@ class BlocklistManager:
            - like www.example.com - to the blocklist. Does not handle URLs."""
         fqdn = self.__check_fqdn(fqdn)
         try:
-            self.cur.callproc('block_fqdn_SP', (fqdn, comment))
+            self.cur.execute('CALL block_fqdn_SP(%s, %s);', (fqdn, comment))
         except pymysql.err.IntegrityError:
             # Just log, do not raise as it does not matter.
-            logging.info("FQDN {fqdn} already on blocklist.")
+            logging.info("FQDN %s already on blocklist.", fqdn)
 
     def unblock_fqdn(self,
                      fqdn: str) -> None:
         "Remove a specific FQDN from the blocklist."
         fqdn = self.__check_fqdn(fqdn)
-        self.cur.callproc('unblock_fqdn_SP', (fqdn, ))
+        self.cur.execute('CALL unblock_fqdn_SP(%s);', (fqdn, ))
 
     def truncate_blocklist(self) -> None:
         "Remove *all* entries from the blocklist."
-        self.cur.callproc('truncate_blocklist_SP')
+        self.cur.execute('CALL truncate_blocklist_SP();')
         logging.info("Truncated the blocklist.")
@@ -11,14 +11,24 @@ Released under the Apache License 2.0
 # standard library:
 from collections import defaultdict  # noqa # pylint: disable=unused-import
 import logging
+import threading
+from typing import Optional
+import weakref
 
 # external dependencies:
 import pymysql
 import userprovided
 
 
+class _ThreadEnd:  # pylint: disable=too-few-public-methods
+    """Stored in the thread-local data, which threading.local drops when
+       the thread ends. Used as the trigger to close its connection."""
+
+
 class DatabaseConnection:
-    """Database connection management for the exoskeleton framework."""
+    """Database connection management for the exoskeleton framework.
+       Every thread gets its own persistent connection which is reused
+       for all queries of that thread and reopened in place if it drops."""
 
     def __init__(self,
                  database_settings: dict) -> None:
@@ -60,31 +70,66 @@ class DatabaseConnection:
             logging.warning(
                 'No database passphrase provided. Trying to connect without.')
 
-        # Establish the database connection
-        self.connection = None
+        # Connections are kept per thread. The connection of a thread is
+        # closed when the thread ends. All open ones are also tracked in a
+        # list, so they can be closed when this object is destroyed.
+        self._local = threading.local()
+        self._all_connections: list = list()
+        self._lock = threading.Lock()
+
+        # Establish the database connection for the current thread
         self.establish_db_connection()
         # Add ignore for mypy as it cannot be None at this point, because
         # establish_db_connection would have failed before:
-        self.cur = self.connection.cursor()  # type: ignore
+        self.cur = self.connection.cursor()  # type: ignore[union-attr]
+        self._local.cursor = self.cur
 
     def __del__(self) -> None:
-        # make sure the connection is closed instead of waiting for timeout:
+        # make sure the connections are closed instead of waiting for timeout:
+        for connection in getattr(self, '_all_connections', []):
+            try:
+                connection.close()
+            except (Exception, pymysql.Error):  # pylint: disable=broad-except
+                pass
+
+    @staticmethod
+    def __close_connection(connection: pymysql.connections.Connection,
+                           all_connections: list,
+                           lock: threading.Lock) -> None:
+        "Close the connection of a thread that ended."
+        with lock:
+            if connection not in all_connections:
+                return
+            all_connections.remove(connection)
         try:
-            self.connection.close()  # type: ignore[attr-defined]
+            connection.close()
         except (Exception, pymysql.Error):  # pylint: disable=broad-except
             pass
 
+    @property
+    def connection(self) -> Optional[pymysql.connections.Connection]:
+        "The persistent connection of the current thread (None if not yet open)."
+        return getattr(self._local, 'connection', None)
+
     def establish_db_connection(self) -> None:
-        "Establish a connection to MariaDB "
+        "Establish a connection to MariaDB for the current thread."
         try:
             logging.debug('Trying to connect to database.')
-            self.connection = pymysql.connect(host=self.db_host,
-                                              port=self.db_port,
-                                              database=self.db_name,
-                                              user=self.db_username,
-                                              password=self.db_passphrase,
-                                              autocommit=True
-                                              )  # type: ignore[assignment]
+            connection = pymysql.connect(host=self.db_host,
+                                         port=self.db_port,
+                                         database=self.db_name,
+                                         user=self.db_username,
+                                         password=self.db_passphrase,
+                                         autocommit=True)
+            self._local.connection = connection
+            with self._lock:
+                self._all_connections.append(connection)
+            # Close the connection as soon as the thread ends instead of
+            # keeping it open until this object is destroyed:
+            self._local.thread_end = _ThreadEnd()
+            weakref.finalize(self._local.thread_end,
+                             self.__close_connection,
+                             connection, self._all_connections, self._lock)
 
             logging.info('Succesfully established database connection.')
 
@@ -102,11 +147,23 @@ class DatabaseConnection:
             raise
 
     def get_cursor(self) -> pymysql.cursors.Cursor:
-        """Make the database cursor accessible from outside the class.
-           Try to reconnect if the connection is lost."""
-        if self.cur:
-            return self.cur
-        logging.info("Lost database connection. Trying to reconnect...")
-        self.establish_db_connection()
-        self.cur = self.connection.cursor()  # type: ignore[attr-defined]
-        return self.cur
+        """Make the database cursor of the current thread accessible from
+           outside the class. Try to reconnect if the connection is lost.
+           The connection is reopened in place, so cursors handed out
+           before stay valid."""
+        connection = self.connection
+        if connection is None:
+            # First request from this thread:
+            self.establish_db_connection()
+            connection = self.connection
+            self._local.cursor = connection.cursor()  # type: ignore[union-attr]
+        elif not connection.open:
+            logging.info("Lost database connection. Trying to reconnect...")
+            try:
+                connection.connect()
+            except pymysql.Error:
+                logging.exception('Could not reconnect to the DBMS.',
+                                  exc_info=True)
+                raise
+            logging.info('Reestablished database connection.')
+        return self._local.cursor
@@ -10,6 +10,7 @@ Released under the Apache License 2.0
 """
 
 import logging
+from typing import Dict, Optional, Set
 
 import pymysql
 
@@ -17,6 +18,11 @@ from exoskeleton import _version as version
 from exoskeleton import database_connection
 from exoskeleton import err
 
+# Databases (host, port, name) whose schema passed the full check in this
+# process. Creating another instance for the same database then skips
+# the slow queries on INFORMATION_SCHEMA.
+_VERIFIED_SCHEMAS: set = set()
+
 
 class DatabaseSchemaCheck:
     "Check the database schema for exoskeleton."
@@ -80,30 +86,55 @@ class DatabaseSchemaCheck:
         "Sets defaults"
         self.cur: pymysql.cursors.Cursor = db_connection.get_cursor()
         self.db_name: str = db_connection.db_name
+        self.cache_key = (db_connection.db_host,
+                          db_connection.db_port,
+                          db_connection.db_name)
+        # Names of the tables, procedures and functions found in the
+        # database. Filled with a single query on first use:
+        self.__found: Optional[Dict[str, Set[str]]] = None
         self.check_db_schema()
 
+    def __schema_elements(self) -> Dict[str, Set[str]]:
+        """Get the names of all expected tables, stored procedures and
+           functions that exist in the database with one round trip.
+           INFORMATION_SCHEMA.ROUTINES only lists routines the user has
+           privileges for, so missing permissions show up as missing
+           elements."""
+        if self.__found is not None:
+            return self.__found
+        routines = self.PROCEDURES + self.FUNCTIONS
+        query = ("SELECT 'TABLE', TABLE_NAME " +
+                 "FROM INFORMATION_SCHEMA.TABLES " +
+                 "WHERE TABLE_SCHEMA = %s AND TABLE_NAME IN ({0}) ".format(
+                     ', '.join(['%s'] * len(self.TABLES))) +
+                 "UNION ALL " +
+                 "SELECT ROUTINE_TYPE, ROUTINE_NAME " +
+                 "FROM INFORMATION_SCHEMA.ROUTINES " +
+                 "WHERE ROUTINE_SCHEMA = %s AND ROUTINE_NAME IN ({0});".format(
+                     ', '.join(['%s'] * len(routines))))
+        self.cur.execute(query, (self.db_name, *self.TABLES,
+                                 self.db_name, *routines))
+        found: Dict[str, Set[str]] = {
+            'TABLE': set(), 'PROCEDURE': set(), 'FUNCTION': set()}
+        for element_type, name in self.cur.fetchall():
+            found[element_type].add(name)
+        self.__found = found
+        return found
+
     def __check_table_existence(self) -> bool:
         "Check if all expected tables exist."
-        # Merely comparing the length of the result set to the number of
-        # expected tables is not sufficient. The user might have added
-        # custom tables.
-        # Therefore check for each expected table if it is in the result.
-        self.cur.execute('SHOW TABLES;')
-        tables = self.cur.fetchall()
-        if not tables:
+        # The user might have added custom tables. Therefore check
+        # for each expected table if it is in the result.
+        tables_found = self.__schema_elements()['TABLE']
+        if not tables_found:
             msg = 'No tables found in database: Run generator script!'
             logging.exception(msg)
             raise err.InvalidDatabaseSchemaError(msg)
 
-        tables_found = [item[0] for item in tables]
-        tables_count = 0
-        for table in self.TABLES:
-            if table in tables_found:
-                tables_count += 1
-            else:
+        missing = set(self.TABLES) - tables_found
+        if missing:
+            for table in sorted(missing):
                 logging.error('Table %s not found.', table)
-
-        if tables_count != len(self.TABLES):
             raise err.InvalidDatabaseSchemaError(
                 'Database Schema Incomplete: Missing Tables!')
 
@@ -113,25 +144,19 @@ class DatabaseSchemaCheck:
     def __check_stored_procedures(self) -> bool:
         """Check if all expected stored procedures exist and if the user
            is allowed to execute them. """
-        self.cur.callproc('db_check_all_procedures_SP', (self.db_name, ))
-        procedures = self.cur.fetchall()
-        if not procedures:
+        procedures_found = self.__schema_elements()['PROCEDURE']
+        if not procedures_found:
             msg = 'No procedures found in database: Run generator script!'
             logging.exception(msg)
             raise RuntimeError(msg)
 
-        procedures_found = [item[0] for item in procedures]
-        count = 0
-        for procedure in self.PROCEDURES:
-            if procedure not in procedures_found:
-                # Do not raise the exception just now.
-                # Log all missing procedures first
+        missing = set(self.PROCEDURES) - procedures_found
+        if missing:
+            # Log all missing procedures before raising the exception:
+            for procedure in sorted(missing):
                 logging.error(
                     'Stored Procedure %s is missing or user lacks permissions.',
                     procedure)
-            else:
-                count += 1
-        if count != len(self.PROCEDURES):
             raise err.InvalidDatabaseSchemaError(
                 'Database Schema Incomplete: Missing Stored Procedures!')
         logging.debug('Database schema: found all expected stored procedures.')
@@ -140,23 +165,18 @@ class DatabaseSchemaCheck:
     def __check_functions(self) -> bool:
         """Check if all expected database functions exist and if the user
            is allowed to execute them. """
-        self.cur.callproc('db_check_all_functions_SP', (self.db_name, ))
-        functions = self.cur.fetchall()
-        if not functions:
+        functions_found = self.__schema_elements()['FUNCTION']
+        if not functions_found:
             msg = 'No functions found in database: Run generator script!'
             logging.exception(msg)
             raise RuntimeError(msg)
 
-        functions_found = [item[0] for item in functions]
-        count = 0
-        for function in self.FUNCTIONS:
-            if function not in functions_found:
+        missing = set(self.FUNCTIONS) - functions_found
+        if missing:
+            for function in sorted(missing):
                 logging.error(
                     'Function %s is missing or user lacks permissions.',
                     function)
-            else:
-                count += 1
-        if count != len(self.FUNCTIONS):
             raise err.InvalidDatabaseSchemaError(
                 'Database Schema Incomplete: Missing Functions!')
         logging.debug('Database schema: found all expected functions.')
@@ -188,8 +208,15 @@ class DatabaseSchemaCheck:
 
     def check_db_schema(self) -> None:
         """Check whether all expected tables, stored procedures and functions
-           are available in the database. Then look for a version string."""
+           are available in the database. Then look for a version string.
+           If the same database has already passed the check within this
+           process, only the version is checked again."""
+        if self.cache_key in _VERIFIED_SCHEMAS:
+            logging.debug('Database schema already checked in this process.')
+            self.__check_schema_version()
+            return
         self.__check_table_existence()
         self.__check_stored_procedures()
         self.__check_functions()
         self.__check_schema_version()
+        _VERIFIED_SCHEMAS.add(self.cache_key)
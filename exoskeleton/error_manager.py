@@ -53,7 +53,7 @@ class CrawlingErrorManager:
         wait_time = 0
 
         # Increase the tries counter and get the new count
-        self.cur.callproc('increment_num_tries_SP', (queue_id, ))
+        self.cur.execute('CALL increment_num_tries_SP(%s);', (queue_id, ))
         response = self.cur.fetchone()
         num_tries = int(response[0]) if response else 0
 
@@ -67,25 +67,20 @@ class CrawlingErrorManager:
         logging.info('Adding crawl delay to task %s', queue_id)
         # Using the class constant DELAY_TRIES because it can be easily
         # overwritten for automatic testing!
-        if num_tries == 1:
-            wait_time = self.DELAY_TRIES[0]  # 15 minutes
-        elif num_tries == 2:
-            wait_time = self.DELAY_TRIES[1]  # 30 minutes
-        elif num_tries == 3:
-            wait_time = self.DELAY_TRIES[2]  # 1 hour
-        elif num_tries == 4:
-            wait_time = self.DELAY_TRIES[3]  # 3 hours
-        elif num_tries > 4:
-            wait_time = self.DELAY_TRIES[4]  # 6 hours
-        self.cur.callproc('add_crawl_delay_SP',
-                          (queue_id, wait_time, error_type))
+        # Steps as defined in DELAY_TRIES. Further tries use the last step.
+        if num_tries > 0:
+            wait_time = self.DELAY_TRIES[
+                min(num_tries, len(self.DELAY_TRIES)) - 1]
+        self.cur.execute('CALL add_crawl_delay_SP(%s, %s, %s);',
+                         (queue_id, wait_time, error_type))
 
     def mark_permanent_error(self,
                              queue_id: str,
                              error: int) -> None:
         """ Mark task in queue that causes a *permanent* error.
             Without this exoskeleton would try to execute it again."""
-        self.cur.callproc('mark_permanent_error_SP', (queue_id, error))
+        self.cur.execute('CALL mark_permanent_error_SP(%s, %s);',
+                         (queue_id, error))
         logging.info('Marked task %s as causing a permanent error.', queue_id)
 
     def forget_specific_error(self,
@@ -94,18 +89,19 @@ class CrawlingErrorManager:
            error, as if they are new tasks by removing that mark and any delay.
            The number of the error has to correspond to the errorType
            database table."""
-        self.cur.callproc('forget_specific_error_type_SP', (specific_error, ))
+        self.cur.execute('CALL forget_specific_error_type_SP(%s);',
+                         (specific_error, ))
 
     def forget_temporary_errors(self) -> None:
         """Treat all queued tasks, that are marked to cause a *temporary*
         error, as if they are new tasks by removing that mark and any delay."""
-        self.cur.callproc('forget_error_group_SP', (0, ))
+        self.cur.execute('CALL forget_error_group_SP(%s);', (0, ))
 
     def forget_permanent_errors(self) -> None:
         """Treat all queued tasks, that are marked to cause a *permanent*
            error, as if they are new tasks by removing that mark and
            any delay."""
-        self.cur.callproc('forget_error_group_SP', (1, ))
+        self.cur.execute('CALL forget_error_group_SP(%s);', (1, ))
 
     def forget_all_errors(self) -> None:
         """Treat all queued tasks, that are marked to cause any type of
@@ -113,7 +109,7 @@ class CrawlingErrorManager:
            task specific delay.
            However, this does not remove delays due to rate limit on a per host
            basis. Use corresponding functions to remove those."""
-        self.cur.callproc("forget_all_errors_SP")
+        self.cur.execute('CALL forget_all_errors_SP();')
 
     def add_rate_limit(self,
                        fqdn: str) -> None:
@@ -124,13 +120,15 @@ class CrawlingErrorManager:
         msg = (f"Bot hit a rate limit with {fqdn}. Will not try to " +
                f"contact this host for {self.rate_limit_wait} seconds.")
         logging.error(msg)
-        self.cur.callproc('add_rate_limit_SP', (fqdn, self.rate_limit_wait))
+        self.cur.execute('CALL add_rate_limit_SP(%s, %s);',
+                         (fqdn, self.rate_limit_wait))
 
     def forget_specific_rate_limit(self,
                                    fqdn: str) -> None:
         "Forget that the bot hit a rate limit for a specific FQDN."
-        self.cur.callproc('forget_specific_rate_limit_SP', (fqdn, ))
+        self.cur.execute('CALL forget_specific_rate_limit_SP(%s);',
+                         (fqdn, ))
 
     def forget_all_rate_limits(self) -> None:
         """Forget all rate limits the bot hit."""
-        self.cur.callproc('forget_all_rate_limits_SP')
+        self.cur.execute('CALL forget_all_rate_limits_SP();')
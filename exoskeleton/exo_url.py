@@ -12,7 +12,7 @@ Released under the Apache License 2.0
 
 from hashlib import sha256
 import logging
-from urllib.parse import urlparse
+from urllib.parse import urlsplit
 
 import userprovided
 
@@ -39,7 +39,10 @@ class ExoUrl:
 
         self.url = url_string
         self.hash: str = self.generate_sha256_hash(self.url)
-        self.hostname = urlparse(self.url).hostname
+        # Parsed once here, so nobody else has to parse the URL again.
+        # urlsplit is sufficient as the hostname does not depend on the
+        # rarely used ;parameters which urlparse would split off.
+        self.hostname = urlsplit(self.url).hostname
 
     def __str__(self) -> str:
         return str(self.url)
@@ -9,8 +9,10 @@ Source: https://github.com/RuedigerVoigt/exoskeleton
 Released under the Apache License 2.0
 """
 # standard library:
+import hashlib
 import logging
 import pathlib
+from typing import Tuple
 
 
 # external dependencies:
@@ -25,6 +27,8 @@ class FileManager:
     "File handling for the exoskeleton framework"
 
     HASH_METHOD = 'sha256'
+    # Size of the blocks in which downloads are written to disk (1 MiB):
+    CHUNK_SIZE = 1024 * 1024
 
     def __init__(self,
                  db_connection: database_connection.DatabaseConnection,
@@ -33,6 +37,8 @@ class FileManager:
                  ) -> None:
         self.cur: pymysql.cursors.Cursor = db_connection.get_cursor()
         self.target_dir = self.__check_target_directory(target_directory)
+        # The directory does not change, so convert it only once:
+        self.target_dir_str = str(self.target_dir)
         logging.info("Saving files in this directory: %s", self.target_dir)
         self.file_prefix = self.__clean_prefix(filename_prefix)
 
@@ -86,28 +92,37 @@ class FileManager:
 
     def write_response_to_file(self,
                                response: requests.Response,
-                               file_name: str) -> pathlib.Path:
-        "Write the server's response into a file."
+                               file_name: str) -> Tuple[pathlib.Path, str, int]:
+        """Write the server's response into a file.
+           The response must have been requested with stream=True.
+           Returns the path, the hash and the size in bytes of the file.
+           Hash and size are computed while writing, so the file does not
+           have to be read again."""
         target_path = self.target_dir.joinpath(file_name)
+        hasher = hashlib.new(self.HASH_METHOD)
+        file_size = 0
+        # iter_content undoes a content-encoding like gzip and translates
+        # urllib3 exceptions into those of requests.
         with open(target_path, 'wb') as file_handle:
-            for block in response.iter_content(1024):
+            for block in response.iter_content(self.CHUNK_SIZE):
                 file_handle.write(block)
+                hasher.update(block)
+                file_size += len(block)
             logging.debug('file written to disk')
 
-        return target_path
-
-    def get_file_hash(self,
-                      file_path: pathlib.Path) -> str:
-        "Calculate the hash of a file (method fixed to SHA256)."
-        hash_value = userprovided.hashing.calculate_file_hash(
-            file_path, self.HASH_METHOD)
-        return hash_value
-
-    @staticmethod
-    def get_file_size(file_path: pathlib.Path) -> int:
-        "File size in bytes."
-        try:
-            return file_path.stat().st_size
-        except Exception:
-            logging.error('Cannot get size of %s', file_path, exc_info=True)
-            raise
+        return target_path, hasher.hexdigest(), file_size
+
+    def get_file_hash_and_size(self,
+                               file_path: pathlib.Path) -> Tuple[str, int]:
+        """Calculate the hash and the size in bytes of a file that was
+           written by another process (like Chrome) with a single read."""
+        hasher = hashlib.new(self.HASH_METHOD)
+        file_size = 0
+        with open(file_path, 'rb') as file_handle:
+            while True:
+                block = file_handle.read(self.CHUNK_SIZE)
+                if not block:
+                    break
+                hasher.update(block)
+                file_size += len(block)
+        return hasher.hexdigest(), file_size
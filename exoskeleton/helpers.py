@@ -11,6 +11,12 @@ Released under the Apache License 2.0
 
 
 from bs4 import BeautifulSoup  # type: ignore
+import lxml.etree  # type: ignore
+import lxml.html  # type: ignore
+
+# The content is always handed to libxml2 as UTF-8 encoded bytes:
+# lxml refuses str input that carries an XML encoding declaration.
+_HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
 
 
 def prettify_html(content: str) -> str:
@@ -27,5 +33,16 @@ def prettify_html(content: str) -> str:
 
 def strip_code(content: str) -> str:
     "Remove code tags from HTMl and return the text"
-    soup = BeautifulSoup(content, 'lxml')
-    return soup.get_text()
+    if not content or content.isspace():
+        return ''
+    try:
+        document = lxml.html.document_fromstring(content.encode('utf-8'),
+                                                 parser=_HTML_PARSER)
+    except lxml.etree.ParserError:
+        # Raised for documents without any element, like a page that
+        # only contains a comment or an XML declaration.
+        return ''
+    # Like Beautiful Soup's get_text, do not return code as text:
+    for element in list(document.iter('script', 'style', 'template')):
+        element.drop_tree()
+    return document.text_content()
@@ -46,7 +46,8 @@ class JobManager:
             start_url = exo_url.ExoUrl(start_url)
         job_name = job_name.strip()
         try:
-            self.cur.callproc('define_new_job_SP', (job_name, start_url))
+            self.cur.execute('CALL define_new_job_SP(%s, %s);',
+                             (job_name, start_url))
             logging.debug('Defined new job.')
         except pymysql.IntegrityError:
             # A job with this name already exists
@@ -85,7 +86,7 @@ class JobManager:
             Raises ValueError if the job is unknown.
             Raises RuntimeError if the job is already finished."""
 
-        self.cur.callproc('job_get_current_url_SP', (job_name, ))
+        self.cur.execute('CALL job_get_current_url_SP(%s);', (job_name, ))
         job_state = self.cur.fetchone()
 
         if job_state is None:
@@ -10,7 +10,7 @@ Released under the Apache License 2.0
 """
 
 import logging
-from typing import Optional, Union
+from typing import Dict, Union
 
 import userprovided
 import pymysql
@@ -26,6 +26,9 @@ class LabelManager:
             db_connection: database_connection.DatabaseConnection) -> None:
         self.db_connection = db_connection
         self.cur: pymysql.cursors.Cursor = self.db_connection.get_cursor()
+        # The id of a label never changes and there is no method to delete
+        # labels. So ids are looked up only once per label name:
+        self.label_ids: Dict[str, int] = dict()
 
     # #########################################################################
     # CREATING LABELS
@@ -47,12 +50,13 @@ class LabelManager:
            In case the label already exists, do not update the description."""
         if not self.__shortname_ok(shortname):
             return
-        try:
-            self.cur.execute('INSERT INTO labels (shortName, description) ' +
-                             'VALUES (%s, %s);',
-                             (shortname, description))
+        # INSERT IGNORE instead of catching an IntegrityError:
+        # execute returns the number of affected rows.
+        if self.cur.execute('INSERT IGNORE INTO labels ' +
+                            '(shortName, description) VALUES (%s, %s);',
+                            (shortname, description)):
             logging.debug('Added label to the database.')
-        except pymysql.err.IntegrityError:
+        else:
             logging.debug('Label already existed.')
 
     def define_or_update_label(self,
@@ -63,13 +67,50 @@ class LabelManager:
             Use __define_new_label if an update has to be avoided. """
         if not self.__shortname_ok(shortname):
             return
-        self.cur.callproc('label_define_or_update_SP',
-                          (shortname, description))
+        self.cur.execute('CALL label_define_or_update_SP(%s, %s);',
+                         (shortname, description))
 
     # #########################################################################
     # ASSIGNING LABELS
     # #########################################################################
 
+    def __prepare_labels(self,
+                         labels: Union[set, str]) -> tuple:
+        """Make sure all labels are in the labels table. Needs one round trip
+           to the database regardless of the number of labels. Returns the
+           labels without duplicates and without malformed ones."""
+        # Using a set to avoid duplicates. However, accept either
+        # a single string or a list type.
+        label_set = userprovided.parameters.convert_to_set(labels)
+        valid_labels = tuple(
+            label for label in label_set if self.__shortname_ok(label))
+        if valid_labels:
+            # Labels that already exist are ignored by the DBMS:
+            self.cur.executemany('INSERT IGNORE INTO labels (shortName) ' +
+                                 'VALUES (%s);',
+                                 [(label, ) for label in valid_labels])
+        return valid_labels
+
+    def __link_labels(self,
+                      link_table: str,
+                      link_column: str,
+                      link_value: str,
+                      labels: tuple) -> None:
+        """Link labels to a fileMaster entry or a version with a single
+           statement. Skips associations that already exist, as the link
+           tables have no unique key which INSERT IGNORE could use."""
+        # Table and column names are set within this class,
+        # so only the values have to be escaped.
+        placeholders = ', '.join(['%s'] * len(labels))
+        self.cur.execute(
+            f"INSERT INTO {link_table} (labelID, {link_column}) "
+            "SELECT l.id, %s FROM labels AS l "
+            f"WHERE l.shortName IN ({placeholders}) "
+            "AND NOT EXISTS ("
+            f"SELECT 1 FROM {link_table} AS x "
+            f"WHERE x.labelID = l.id AND x.{link_column} = %s);",
+            (link_value, *labels, link_value))
+
     def assign_labels_to_master(self,
                                 url: Union[exo_url.ExoUrl, str],
                                 labels: set) -> None:
@@ -82,41 +123,10 @@ class LabelManager:
         if not isinstance(url, exo_url.ExoUrl):
             url = exo_url.ExoUrl(url)
 
-        # Using a set to avoid duplicates. However, accept either
-        # a single string or a list type.
-        label_set = userprovided.parameters.convert_to_set(labels)
-
-        for label in label_set:
-            # Make sure all labels are in the database table.
-            # -> If they already exist or are malformed, the command
-            # will be ignored by the DBMS.
-            self.define_new_label(label)
-
-        # Get all label-ids
-        id_list = self.get_label_ids(label_set)
-
-        # Check whether some labels are already associated
-        # with the fileMaster entry.
-        self.cur.execute('SELECT labelID ' +
-                         'FROM labelToMaster ' +
-                         'WHERE urlHash = SHA2(%s,256);', (url, ))
-        ids_found: Optional[tuple] = self.cur.fetchall()
-        ids_associated = set()
-        if ids_found:
-            ids_associated = set(ids_found)
-
-        # ignore all labels already associated:
-        remaining_ids = tuple(id_list - ids_associated)
-
-        if len(remaining_ids) > 0:
-            # Case: there are new labels
-            # Convert into a format to INSERT with executemany
-            insert_list = [(id, url) for id in remaining_ids]
-            # Add those associatons
-            self.cur.executemany('INSERT IGNORE INTO labelToMaster ' +
-                                 '(labelID, urlHash) ' +
-                                 'VALUES (%s, SHA2(%s,256));',
-                                 insert_list)
+        valid_labels = self.__prepare_labels(labels)
+        if valid_labels:
+            self.__link_labels(
+                'labelToMaster', 'urlHash', url.hash, valid_labels)
         return None
 
     def assign_labels_to_uuid(self,
@@ -127,35 +137,10 @@ class LabelManager:
         if not labels:
             return
 
-        # Using a set to avoid duplicates. However, users might provide
-        # a string or a list type.
-        label_set = userprovided.parameters.convert_to_set(labels)
-
-        for label in label_set:
-            # Make sure all labels are in the database table.
-            # -> If they already exist or are malformed, the command
-            # will be ignored by the DBMS.
-            self.define_new_label(label)
-
-        # Get all label-ids
-        id_list = self.get_label_ids(label_set)
-
-        # Check if there are already labels assigned with the version
-        self.cur.execute('SELECT labelID ' +
-                         'FROM labelToVersion ' +
-                         'WHERE versionUUID = %s;', (uuid_string, ))
-        ids_found = self.cur.fetchall()
-        ids_associated = set(ids_found) if ids_found else set()
-        # ignore all labels already associated:
-        remaining_ids = tuple(id_list - ids_associated)
-
-        if len(remaining_ids) > 0:
-            # Case: there are new labels
-            # Convert into a format to INSERT with executemany
-            insert_list = [(id, uuid_string) for id in remaining_ids]
-            self.cur.executemany('INSERT IGNORE INTO labelToVersion ' +
-                                 '(labelID, versionUUID) ' +
-                                 'VALUES (%s, %s);', insert_list)
+        valid_labels = self.__prepare_labels(labels)
+        if valid_labels:
+            self.__link_labels(
+                'labelToVersion', 'versionUUID', uuid_string, valid_labels)
 
     # #########################################################################
     # QUERY LABELS
@@ -177,18 +162,17 @@ class LabelManager:
            filemaster entry using the URL associated."""
         if not isinstance(url, exo_url.ExoUrl):
             url = exo_url.ExoUrl(url)
-        self.cur.callproc('labels_filemaster_by_url_SP', (url, ))
-        labels = self.cur.fetchall()
-        return {(label[0]) for label in labels} if labels else set()
+        self.cur.execute('CALL labels_filemaster_by_url_SP(%s);', (url, ))
+        return {label[0] for label in self.cur.fetchall()}
 
     def version_labels_by_uuid(self,
                                version_uuid: str) -> set:
         """Get a list of label names (not id numbers!) attached to a specific
            version of a file. Does not include labels attached to the
            filemaster entry."""
-        self.cur.callproc('labels_version_by_id_SP', (version_uuid, ))
-        labels = self.cur.fetchall()
-        return {(label[0]) for label in labels} if labels else set()
+        self.cur.execute('CALL labels_version_by_id_SP(%s);',
+                         (version_uuid, ))
+        return {label[0] for label in self.cur.fetchall()}
 
     def all_labels_by_uuid(self,
                            version_uuid: str) -> set:
@@ -208,22 +192,32 @@ class LabelManager:
     def get_label_ids(self,
                       label_set: Union[set, str]) -> set:
         """ Given a set of labels, this returns the corresponding ids
-            in the labels table. """
+            in the labels table. Only labels not looked up before
+            are queried. """
         if not label_set:
             logging.error('No labels provided to get_label_ids().')
             return set()
 
         label_set = userprovided.parameters.convert_to_set(label_set)
-        # The IN-Operator makes it necessary to construct the command
-        # every time, so input gets escaped. See the accepted answer here:
-        # https://stackoverflow.com/questions/14245396/using-a-where-in-statement
-        query = ("SELECT id " +
-                 "FROM labels " +
-                 "WHERE shortName " +
-                 "IN ({0});".format(', '.join(['%s'] * len(label_set))))
-        self.cur.execute(query, tuple(label_set))
-        label_id = self.cur.fetchall()
-        return {(id[0]) for id in label_id} if label_id else set()
+        ids_found = {self.label_ids[label] for label in label_set
+                     if label in self.label_ids}
+        missing = label_set - self.label_ids.keys()
+        if missing:
+            # The IN-Operator makes it necessary to construct the command
+            # every time, so input gets escaped. See the accepted answer here:
+            # https://stackoverflow.com/questions/14245396/using-a-where-in-statement
+            query = ("SELECT shortName, id " +
+                     "FROM labels " +
+                     "WHERE shortName " +
+                     "IN ({0});".format(', '.join(['%s'] * len(missing))))
+            self.cur.execute(query, tuple(missing))
+            for shortname, label_id in self.cur.fetchall():
+                ids_found.add(label_id)
+                # The collation ignores case, so the label in the database
+                # might differ from the one asked for. Cache exact matches only.
+                if shortname in missing:
+                    self.label_ids[shortname] = label_id
+        return ids_found
 
     def version_uuids_by_label(self,
                                single_label: str,
@@ -251,8 +245,7 @@ class LabelManager:
                              "FROM labelToVersion " +
                              "WHERE labelID = %s;",
                              (label_id, ))
-        version_ids = self.cur.fetchall()
-        return {(uuid[0]) for uuid in version_ids} if version_ids else set()
+        return {uuid[0] for uuid in self.cur.fetchall()}
 
     # #########################################################################
     # REMOVING LABELS
@@ -272,4 +265,5 @@ class LabelManager:
         id_list = self.get_label_ids(labels_to_remove)
 
         for label_id in id_list:
-            self.cur.callproc('remove_labels_from_uuid_SP', (label_id, uuid))
+            self.cur.execute('CALL remove_labels_from_uuid_SP(%s, %s);',
+                             (label_id, uuid))
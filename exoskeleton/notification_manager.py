@@ -9,8 +9,12 @@ Source: https://github.com/RuedigerVoigt/exoskeleton
 Released under the Apache License 2.0
 """
 from collections import defaultdict  # noqa # pylint: disable=unused-import
+from concurrent.futures import ThreadPoolExecutor
 import logging
-from typing import Optional
+import re
+import smtplib
+import time
+from typing import Any, Callable, Optional, Tuple, Union
 
 import bote
 import userprovided
@@ -24,6 +28,14 @@ class NotificationManager:
        At the moment this sends out email, but it may support other
        notification methods in future versions."""
 
+    # SMTP reply codes for temporary failures. Greylisting servers reply
+    # with one of them and expect the sender to try again later:
+    TEMPORARY_SMTP_CODES = (421, 450, 451, 452)
+    # Some greylisting servers state how long to wait:
+    RETRY_INTERVAL = re.compile(r'(\d+)\s*sec', re.IGNORECASE)
+    DEFAULT_RETRY_SECONDS = 60
+    MAX_RETRY_SECONDS = 900
+
     def __init__(self,
                  project_name: str,
                  mail_settings: dict,
@@ -35,8 +47,15 @@ class NotificationManager:
         # pylint: disable=too-many-arguments
 
         self.project_name = project_name
+        # The project name does not change, so build those subjects once:
+        self.subject_start = f"Project {project_name} just started."
+        self.subject_finish = f"{project_name}: queue empty / bot stopped"
+        self.subject_abort = f"Project {project_name} ABORTED"
 
         self.send_mails: bool = False
+        self.send_finish_msg: bool = False
+        # Created with the first mail sent in the background:
+        self.__executor: Optional[ThreadPoolExecutor] = None
 
         if not mail_settings:
             logging.info("No mail-settings: will not send any notifications.")
@@ -47,15 +66,116 @@ class NotificationManager:
             self.send_mails = True
             logging.debug('This bot will try to send notifications.')
 
-            if mail_behavior.get('send_start_msg', True):
-                self.__send_msg_start()
-
+            # Validate all flags before the first mail goes out:
+            send_start_msg = mail_behavior.get('send_start_msg', True)
+            userprovided.parameters.enforce_boolean(
+                send_start_msg, 'send_start_msg')
             self.send_finish_msg = mail_behavior.get('send_finish_msg', False)
             userprovided.parameters.enforce_boolean(
                 self.send_finish_msg, 'send_finish_msg')
+
+            if send_start_msg:
+                self.__send_msg_start()
         self.time = time_manager_object
         self.stats = stats_manager_object
         self.milestone = milestone
+        # Milestones reached faster than this are not reported on their own,
+        # but the next milestone message mentions them:
+        self.milestone_min_interval = userprovided.parameters.int_in_range(
+            'milestone_min_interval',
+            mail_behavior.get('milestone_min_interval', 300),
+            0, 86400, 300)
+        self.last_milestone_msg: Optional[float] = None
+        self.skipped_milestones: int = 0
+
+    @staticmethod
+    def __smtp_reply(error: smtplib.SMTPException
+                     ) -> Optional[Tuple[int, str]]:
+        "Extract the SMTP reply code and message from an exception."
+        message: Union[bytes, str]
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            if not error.recipients:
+                return None
+            code, message = next(iter(error.recipients.values()))
+        elif isinstance(error, smtplib.SMTPResponseException):
+            code, message = error.smtp_code, error.smtp_error
+        else:
+            return None
+        text = (message.decode('utf-8', errors='replace')
+                if isinstance(message, bytes) else message)
+        return code, text
+
+    def __send(self,
+               subject: str,
+               body: str,
+               in_background: bool = False) -> None:
+        """Send a mail. If the receiving server rejects it temporarily (for
+           example because of greylisting), try once more after the interval
+           the server asked for or a default interval. The background thread
+           simply waits for the retry. Otherwise the retry is handed over to
+           the background thread, so the bot is not blocked."""
+        try:
+            self.mailer.send_mail(subject, body)
+            return
+        except smtplib.SMTPException as error:
+            reply = self.__smtp_reply(error)
+            if reply is None or reply[0] not in self.TEMPORARY_SMTP_CODES:
+                raise
+        interval_match = self.RETRY_INTERVAL.search(reply[1])
+        wait_seconds = (int(interval_match.group(1)) if interval_match
+                        else self.DEFAULT_RETRY_SECONDS)
+        wait_seconds = min(wait_seconds, self.MAX_RETRY_SECONDS)
+        logging.warning(
+            'Mail server rejected mail temporarily (%s). ' +
+            'Will retry in %s seconds.', reply[0], wait_seconds)
+        if in_background:
+            self.__retry(subject, body, wait_seconds)
+        else:
+            self.__submit(self.__retry, subject, body, wait_seconds)
+
+    def __retry(self,
+                subject: str,
+                body: str,
+                wait_seconds: int) -> None:
+        "Wait, then try to send the mail a last time. Runs in the background."
+        time.sleep(wait_seconds)
+        try:
+            self.mailer.send_mail(subject, body)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Retry to send "%s" failed. Giving up.', subject)
+
+    def __send_and_log_errors(self,
+                              subject: str,
+                              body: str) -> None:
+        "Send a mail. Log errors as no one can catch them in a thread."
+        try:
+            self.__send(subject, body, in_background=True)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Could not send notification "%s".', subject)
+
+    def __submit(self,
+                 function: Callable[..., None],
+                 *args: Any) -> None:
+        """Hand a task over to a single worker thread, so the bot does not
+           wait for the mail server. One worker keeps the order of the
+           messages."""
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='exo-mail')
+        self.__executor.submit(function, *args)
+
+    def __send_in_background(self,
+                             subject: str,
+                             body: str) -> None:
+        "Send a mail in the background thread."
+        self.__submit(self.__send_and_log_errors, subject, body)
+
+    def wait_for_pending_mails(self) -> None:
+        """Block until all mails handed over to the background are sent,
+           including retries. Called before the bot stops."""
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+            self.__executor = None
 
     def __check_is_milestone(self) -> bool:
         "Check if a milestone is reached."
@@ -71,7 +191,13 @@ class NotificationManager:
     def send_msg_milestone(self) -> None:
         """In case a milestone is defined and reached, send an email with
            an estimate how long it will take for the bot to finish."""
-        if not self.__check_is_milestone():
+        if not self.send_mails or not self.__check_is_milestone():
+            return
+        if (self.last_milestone_msg is not None and
+                time.monotonic() - self.last_milestone_msg <
+                self.milestone_min_interval):
+            self.skipped_milestones += 1
+            logging.debug('Milestone message skipped: sent one just now.')
             return
         stats = self.stats.queue_stats()
         processed = self.stats.get_processed_counter()
@@ -82,39 +208,45 @@ class NotificationManager:
 
         subject = (
             f"Project {self.project_name} Milestone: {processed} processed")
-        body = (f"{processed} processed.\n" +
-                f"{remaining} tasks remaining in the queue.\n" +
-                "Estimated time to complete queue: " +
+        body = (f"{processed} processed.\n"
+                f"{remaining} tasks remaining in the queue.\n"
+                "Estimated time to complete queue: "
                 f"{round(time_to_finish_seconds / 60)} minutes.\n")
-        self.mailer.send_mail(subject, body)
+        if self.skipped_milestones:
+            body += (f"{self.skipped_milestones} milestone(s) since the last "
+                     "message were not reported separately.\n")
+        self.__send_in_background(subject, body)
+        self.last_milestone_msg = time.monotonic()
+        self.skipped_milestones = 0
 
     def __send_msg_start(self) -> None:
         "Send a notification about the start of the bot."
-        self.mailer.send_mail(f"Project {self.project_name} just started.",
-                              "The bot just started.")
+        self.__send(self.subject_start, "The bot just started.")
         logging.debug('Sent a message announcing the start')
 
     def send_msg_finish(self) -> None:
         """If configured so, send an email once the queue is empty
            and the bot stopped."""
         if self.send_mails and self.send_finish_msg:
-            subject = f"{self.project_name}: queue empty / bot stopped"
-            body = (f"The queue is empty. The bot {self.project_name} " +
-                    "stopped as configured. " +
+            body = (f"The queue is empty. The bot {self.project_name} "
+                    "stopped as configured. "
                     f"{self.stats.num_tasks_w_permanent_errors()} errors.")
-            self.mailer.send_mail(subject, body)
+            self.__send_in_background(self.subject_finish, body)
 
     def send_msg_abort_lost_db(self) -> None:
         "Send a message that the bot cannot connect to the database."
-        self.mailer.send_mail(
-            f"Project {self.project_name} ABORTED",
+        if not self.send_mails:
+            return
+        self.__send_in_background(
+            self.subject_abort,
             ("The bot lost the database connection and could not restore it.")
              )
-        logging.debug('Sent a message about lost database connection.')
+        logging.debug('Queued a message about lost database connection.')
 
     def send_custom_msg(self,
                         subject: str,
                         body: str) -> None:
-        "Send a custom message if the bot is configured and able to do so."
+        """Send a custom message if the bot is configured and able to do so.
+           The mail is sent in the background and errors are only logged."""
         if self.send_mails:
-            self.mailer.send_mail(subject, body)
+            self.__send_in_background(subject, body)
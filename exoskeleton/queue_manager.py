@@ -38,6 +38,20 @@ class QueueManager:
     # pylint: disable=too-many-statements
     # pylint: disable=too-many-branches
 
+    # All checks add_to_queue needs before it inserts a task, with one round
+    # trip: Is the host on the blocklist? What is the id of the fileMaster
+    # entry for the URL (if any)? Has this URL already been processed with
+    # the same action? Is the very same task already in the queue?
+    ADD_PRECHECK_QUERY = (
+        'SELECT fqdn_on_blocklist(%s), fm.id, ' +
+        'EXISTS (SELECT 1 FROM fileVersions AS fv ' +
+        '        WHERE fv.fileMasterID = fm.id ' +
+        '        AND fv.actionAppliedID = %s), ' +
+        'EXISTS (SELECT 1 FROM queue AS q ' +
+        '        WHERE q.urlHash = %s AND q.action = %s) ' +
+        'FROM (SELECT 1) AS one_row ' +
+        'LEFT JOIN fileMaster AS fm ON fm.urlHash = %s;')
+
     def __init__(
             self,
             db_connection: database_connection.DatabaseConnection,
@@ -85,8 +99,14 @@ class QueueManager:
         if action not in (1, 2, 3, 4):
             raise ValueError('Invalid value for action!')
 
-        # Check if the FQDN of the URL is on the blocklist
-        if url.hostname and self.blocklist.check_blocklist(url.hostname):
+        self.cur.execute(self.ADD_PRECHECK_QUERY,
+                         (url.hostname or '', action,
+                          url.hash, action, url.hash))
+        # The query always returns exactly one row:
+        (on_blocklist, id_in_file_master,
+         processed_same_way, task_in_queue) = self.cur.fetchone()  # type: ignore[misc]
+
+        if on_blocklist:
             msg = 'Cannot add URL to queue: FQDN is on blocklist.'
             logging.exception(msg)
             raise err.HostOnBlocklistError(msg)
@@ -98,18 +118,10 @@ class QueueManager:
             self.labels.assign_labels_to_master(url, labels_master)
 
         if not force_new_version:
-            # check if the URL has already been processed
-            id_in_file_master = self.get_filemaster_id_by_url(url)
-
             if id_in_file_master:
                 # The URL has been processed in _some_ way.
                 # Check if was the _same_ as now requested.
-                self.cur.execute('SELECT id FROM fileVersions ' +
-                                 'WHERE fileMasterID = %s AND ' +
-                                 'actionAppliedID = %s;',
-                                 (id_in_file_master, action))
-                version_id = self.cur.fetchone()
-                if version_id:
+                if processed_same_way:
                     logging.info(
                         'Skipping file already processed in the same way.')
                     return None
@@ -117,19 +129,18 @@ class QueueManager:
                 # log and simply go on
                 logging.debug(
                     'File already processed, BUT not this way: Added to queue.')
-            else:
-                # File has not been processed yet.
-                # If the exact same task is *not* already in the queue, add it.
-                if self.__get_queue_uuids(url, action):
-                    logging.info('Exact same task already in queue.')
-                    return None
+            elif task_in_queue:
+                # File has not been processed yet, but the exact
+                # same task is already in the queue.
+                logging.info('Exact same task already in queue.')
+                return None
 
         # generate a random uuid for the file version
         uuid_value = uuid.uuid4().hex
 
         # add the new task to the queue
-        self.cur.callproc('add_to_queue_SP',
-                          (uuid_value, action, url, url.hostname, prettify_html))
+        self.cur.execute('CALL add_to_queue_SP(%s, %s, %s, %s, %s);',
+                         (uuid_value, action, url, url.hostname, prettify_html))
 
         # link labels to version item
         if labels_version:
@@ -137,31 +148,14 @@ class QueueManager:
 
         return uuid_value
 
-    def __get_queue_uuids(self,
-                          url: exo_url.ExoUrl,
-                          action: int) -> set:
-        """Based on the URL and action ID this returns a set of UUIDs in the
-           *queue* that match those. Normally this set has a single element,
-           but as you can force exoskeleton to repeat tasks on the same
-           URL it can be multiple. Returns an empty set if such combination
-           is not in the queue."""
-        self.cur.execute('SELECT id FROM queue ' +
-                         'WHERE urlHash = SHA2(%s,256) AND ' +
-                         'action = %s ' +
-                         'ORDER BY addedToQueue ASC;',
-                         (url, action))
-        queue_uuids = self.cur.fetchall()
-        return {uuid[0] for uuid in queue_uuids} if queue_uuids else set()
-
     def get_filemaster_id_by_url(self,
                                  url: Union[exo_url.ExoUrl, str]
                                  ) -> Optional[str]:
         "Get the id of the filemaster entry associated with this URL"
         if not isinstance(url, exo_url.ExoUrl):
             url = exo_url.ExoUrl(url)
-        self.cur.execute('SELECT id FROM fileMaster ' +
-                         'WHERE urlHash = SHA2(%s,256);',
-                         (url, ))
+        self.cur.execute('SELECT id FROM fileMaster WHERE urlHash = %s;',
+                         (url.hash, ))
         id_in_file_master = self.cur.fetchone()
         return id_in_file_master[0] if id_in_file_master else None
 
@@ -177,7 +171,7 @@ class QueueManager:
     def delete_from_queue(self,
                           queue_id: str) -> None:
         "Remove all label links from item and delete it from the queue."
-        self.cur.callproc('delete_from_queue_SP', (queue_id,))
+        self.cur.execute('CALL delete_from_queue_SP(%s);', (queue_id,))
 
     def process_queue(self) -> None:
         "Process the queue"
@@ -200,6 +194,7 @@ class QueueManager:
                         msg = 'Could not reestablish database connection'
                         logging.exception(msg, exc_info=True)
                         self.notify.send_msg_abort_lost_db()
+                        self.notify.wait_for_pending_mails()
                         raise ConnectionError(msg) from exc
                 else:
                     logging.error(
@@ -228,6 +223,7 @@ class QueueManager:
                         logging.error("%s permanent errors!",
                                       num_permanent_errors)
                     self.notify.send_msg_finish()
+                    self.notify.wait_for_pending_mails()
                     break
 
                 logging.debug(
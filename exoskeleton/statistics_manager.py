@@ -21,6 +21,33 @@ from exoskeleton import exo_url
 class StatisticsManager:
     """Manage the statistics like counting requests and errors,"""
 
+    # Tasks not marked as permanent error, whose host has an active rate
+    # limit. A join instead of the "IN (subquery)" in the SQL function
+    # num_tasks_with_active_rate_limit(). Contrary to that function this
+    # also counts tasks without any error: "causesError NOT IN (...)" is
+    # NULL for them and so excluded them.
+    RATE_LIMITED_QUERY = (
+        'SELECT COUNT(*) FROM queue AS q ' +
+        'JOIN rateLimits AS rl ON rl.fqdnHash = q.fqdnHash ' +
+        '    AND rl.noContactUntil > NOW() ' +
+        'LEFT JOIN errorType AS e ON e.id = q.causesError ' +
+        'WHERE COALESCE(e.permanent, 0) = 0;')
+
+    # The four counts of queue_stats with a single pass over the queue.
+    # Same definitions as the num_tasks_* methods.
+    # rateLimits has the FQDN hash as primary key and errorType the id,
+    # so the joins do not multiply rows.
+    QUEUE_STATS_QUERY = (
+        'SELECT COUNT(*) - COUNT(q.causesError), ' +
+        'COALESCE(SUM(e.permanent = 0), 0), ' +
+        'COALESCE(SUM(e.permanent = 1), 0), ' +
+        'COALESCE(SUM(COALESCE(e.permanent, 0) = 0 ' +
+        '    AND rl.fqdnHash IS NOT NULL), 0) ' +
+        'FROM queue AS q ' +
+        'LEFT JOIN errorType AS e ON e.id = q.causesError ' +
+        'LEFT JOIN rateLimits AS rl ON rl.fqdnHash = q.fqdnHash ' +
+        '    AND rl.noContactUntil > NOW();')
+
     def __init__(self,
                  db_connection: database_connection.DatabaseConnection
                  ) -> None:
@@ -49,17 +76,20 @@ class StatisticsManager:
     def num_tasks_w_rate_limit(self) -> int:
         """Number of tasks in the queue that do not yield a permanent error,
            but are currently affected by a rate limit."""
-        self.cur.execute("SELECT num_tasks_with_active_rate_limit();")
+        self.cur.execute(self.RATE_LIMITED_QUERY)
         num_rate_limited = self.cur.fetchone()
         return int(num_rate_limited[0]) if num_rate_limited else 0
 
     def queue_stats(self) -> dict:
-        """Return a number of statistics about the queue as a dictionary."""
+        """Return a number of statistics about the queue as a dictionary.
+           Needs one query instead of calling the four num_tasks_* methods."""
+        self.cur.execute(self.QUEUE_STATS_QUERY)
+        counts = self.cur.fetchone() or (0, 0, 0, 0)
         stats = {
-            'tasks_without_error': self.num_tasks_wo_errors(),
-            'tasks_with_temp_errors': self.num_tasks_w_temporary_errors(),
-            'tasks_with_permanent_errors': self.num_tasks_w_permanent_errors(),
-            'tasks_blocked_by_rate_limit': self.num_tasks_w_rate_limit()
+            'tasks_without_error': int(counts[0]),
+            'tasks_with_temp_errors': int(counts[1]),
+            'tasks_with_permanent_errors': int(counts[2]),
+            'tasks_blocked_by_rate_limit': int(counts[3])
         }
         return stats
 
@@ -85,15 +115,16 @@ class StatisticsManager:
                 permanent_errors_increment: Literal[0, 1] = 0,
                 hit_rate_limit_increment: Literal[0, 1] = 0
                 ) -> None:
-        """ Updates the host based statistics. The URL gets shortened to
-            the hostname. Increase the different counters."""
+        """ Updates the host based statistics. The hostname is taken from
+            the ExoUrl object, which parsed it once on creation.
+            Increase the different counters."""
         # pylint: disable=too-many-arguments
-        self.cur.callproc('update_host_stats_SP',
-                          (url.hostname,
-                           successful_requests_increment,
-                           temporary_problems_increment,
-                           permanent_errors_increment,
-                           hit_rate_limit_increment))
+        self.cur.execute('CALL update_host_stats_SP(%s, %s, %s, %s, %s);',
+                         (url.hostname,
+                          successful_requests_increment,
+                          temporary_problems_increment,
+                          permanent_errors_increment,
+                          hit_rate_limit_increment))
 
     def log_successful_request(self,
                                url: exo_url.ExoUrl) -> None:
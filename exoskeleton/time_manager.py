@@ -12,6 +12,7 @@ Released under the Apache License 2.0
 import logging
 import random
 import time
+from typing import Union
 
 
 class TimeManager:
@@ -21,15 +22,16 @@ class TimeManager:
         * estimate time need """
 
     def __init__(self,
-                 wait_min: int = 5,
-                 wait_max: int = 30):
+                 wait_min: Union[int, float] = 5,
+                 wait_max: Union[int, float] = 30):
         """Sets defaults"""
 
-        # Check input validity:
-        if type(wait_min) not in (int, float):
-            raise ValueError('The value for wait_min must be numeric.')
-        if type(wait_max) not in (int, float):
-            raise ValueError('The value for wait_max must be numeric.')
+        # Check input validity. bool is a subclass of int, but
+        # True / False are no sensible number of seconds:
+        for name, value in (('wait_min', wait_min), ('wait_max', wait_max)):
+            if (not isinstance(value, (int, float)) or
+                    isinstance(value, bool)):
+                raise ValueError(f"The value for {name} must be numeric.")
         if wait_min > wait_max:
             raise ValueError("wait_max cannot be larger than wait_min.")
         self.wait_min = wait_min
@@ -45,8 +47,10 @@ class TimeManager:
            (within the interval preset at initialization).
            This is done to avoid to accidentally overload the queried host.
            Some host actually enforce limits through IP blocking."""
-        query_delay = random.randint(self.wait_min, self.wait_max)  # nosec
-        logging.debug("%s seconds delay until next action", query_delay)
+        # uniform instead of randint: wait times may be floats and
+        # whole seconds would make the pattern easier to recognize.
+        query_delay = random.uniform(self.wait_min, self.wait_max)  # nosec
+        logging.debug("%.2f seconds delay until next action", query_delay)
         time.sleep(query_delay)
 
     def increase_wait(self) -> None:
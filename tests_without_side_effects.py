@@ -33,25 +33,52 @@ Source: https://github.com/RuedigerVoigt/exoskeleton
 Released under the Apache License 2.0
 """
 
+from decimal import Decimal
+import hashlib
+import http.client
+import io
 import logging
-from unittest.mock import patch
+import smtplib
+import threading
+from unittest.mock import call, MagicMock, PropertyMock, patch
 
 logging.basicConfig(level=logging.DEBUG)
 
 import pyfakefs
 import pytest
+import requests
+import urllib3
 
 
 from exoskeleton import actions
 from exoskeleton import database_connection
+from exoskeleton import database_schema_check
+from exoskeleton import err
+from exoskeleton import error_manager
 from exoskeleton import exo_url
 from exoskeleton import file_manager
 from exoskeleton import helpers
+from exoskeleton import label_manager
 from exoskeleton import notification_manager
+from exoskeleton import queue_manager
 from exoskeleton import remote_control_chrome
+from exoskeleton import statistics_manager
 from exoskeleton import time_manager
 
 
+# #############################################################################
+# CrawlingErrorManager Class
+# #############################################################################
+
+def test_CrawlingErrorManager_add_crawl_delay_STEPS(mock_db, cursor):
+    my_em = error_manager.CrawlingErrorManager(mock_db, 10, 1860)
+    expected = (900, 1800, 3600, 10800, 21600, 21600, 21600)
+    for num_tries, wait_time in enumerate(expected, start=1):
+        cursor.fetchone.return_value = (num_tries, )
+        my_em.add_crawl_delay('abc', 1)
+        assert cursor.execute.call_args[0][1] == ('abc', wait_time, 1)
+
+
 # #############################################################################
 # DatabaseConnection Class
 # #############################################################################
@@ -80,6 +107,73 @@ def test_DatabaseConnection():
             database_settings={'database': 'foo', 'username': 'foo', 'port': 999999999})
         assert "port outside valid range" in str(excinfo.value)
 
+
+def test_DatabaseConnection_persistent_per_thread():
+    settings = {'database': 'foo', 'username': 'foo', 'passphrase': 'bar'}
+    with patch('pymysql.connect', side_effect=lambda **kwargs: MagicMock()) as mock_connect:
+        db = database_connection.DatabaseConnection(settings)
+        assert mock_connect.call_count == 1
+        # The same thread reuses its connection and cursor:
+        first_cursor = db.get_cursor()
+        assert db.get_cursor() is first_cursor
+        assert mock_connect.call_count == 1
+        # A lost connection is reopened in place:
+        db.connection.open = False
+        assert db.get_cursor() is first_cursor
+        db.connection.connect.assert_called_once()
+        assert mock_connect.call_count == 1
+        # Another thread gets a connection of its own:
+        other_cursor = []
+        other_connection = []
+
+        def work() -> None:
+            other_cursor.append(db.get_cursor())
+            other_connection.append(db.connection)
+        worker = threading.Thread(target=work)
+        worker.start()
+        worker.join()
+        assert mock_connect.call_count == 2
+        assert other_cursor[0] is not first_cursor
+        # ... which is closed as soon as that thread ends:
+        assert db._all_connections == [db.connection]
+        other_connection[0].close.assert_called_once()
+        db.connection.close.assert_not_called()
+
+
+# #############################################################################
+# DatabaseSchemaCheck Class
+# #############################################################################
+
+
+def test_DatabaseSchemaCheck_single_query_and_cache(mock_db, cursor):
+    check_class = database_schema_check.DatabaseSchemaCheck
+    complete = ([('TABLE', t) for t in check_class.TABLES] +
+                [('PROCEDURE', p) for p in check_class.PROCEDURES] +
+                [('FUNCTION', f) for f in check_class.FUNCTIONS])
+    mock_db.db_host, mock_db.db_port, mock_db.db_name = 'localhost', 3306, 'unittest'
+    cursor.fetchall.return_value = complete
+    cursor.fetchone.return_value = ('2.0.0', )
+    database_schema_check._VERIFIED_SCHEMAS.clear()
+    check_class(mock_db)
+    # All elements are looked up in information_schema, filtered by schema:
+    element_check, version_check = cursor.execute.call_args_list
+    query, params = element_check[0]
+    assert 'INFORMATION_SCHEMA' in query
+    assert params[0] == 'unittest'
+    assert set(check_class.TABLES) <= set(params)
+    assert version_check == call('SELECT exo_schema_version() AS version;')
+    # Second instance for the same database: only the version is checked
+    cursor.reset_mock()
+    check_class(mock_db)
+    assert cursor.execute.call_args_list == [version_check]
+    # A missing procedure is detected
+    database_schema_check._VERIFIED_SCHEMAS.clear()
+    cursor.fetchall.return_value = [row for row in complete if row[1] != 'insert_file_SP']
+    with pytest.raises(err.InvalidDatabaseSchemaError):
+        check_class(mock_db)
+    database_schema_check._VERIFIED_SCHEMAS.clear()
+
+
 # #############################################################################
 # ExoActions Class
 # #############################################################################
@@ -108,6 +202,79 @@ def test_actions_MISSING_URL():
                 )
     assert "Missing parameter url" in str(excinfo.value)
 
+@pytest.mark.parametrize('status_code, expected_log',
+                         [(404, 'log_permanent_error'),
+                          (429, 'log_rate_limit_hit'),
+                          (503, 'log_temporary_problem')])
+def test_actions_ONE_STATS_UPDATE_PER_OUTCOME(action_objects, status_code, expected_log):
+    stats = action_objects['stats_manager_object']
+    response = MagicMock(status_code=status_code)
+    action_objects['session'].get.return_value = response
+    actions.GetFile(action_objects, 'foo', exo_url.ExoUrl('https://www.example.com'))
+    getattr(stats, expected_log).assert_called_once()
+    stats.log_successful_request.assert_not_called()
+    # The streamed connection is released:
+    response.close.assert_called_once()
+
+
+def test_actions_SESSION_KEEPS_NO_COOKIES():
+    exo_actions = actions.ExoActions(
+        MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock(),
+        MagicMock(), 'test-agent', 60)
+    request = requests.Request('GET', 'https://www.example.com/').prepare()
+    reply = MagicMock()
+    reply._original_response.msg = http.client.parse_headers(
+        io.BytesIO(b'Set-Cookie: session=abc; Path=/\r\n\r\n'))
+    requests.cookies.extract_cookies_to_jar(
+        exo_actions.session.cookies, request, reply)
+    assert len(exo_actions.session.cookies) == 0
+
+
+@pytest.mark.parametrize('content_type, expected',
+                         [('text/plain', 'if a <b and c> d'),
+                          ('text/csv', 'if a <b and c> d'),
+                          ('text/html', 'if a  d')])
+def test_actions_TEXT_OF_PLAIN_TYPES_VERBATIM(action_objects, cursor, content_type, expected):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b'if a <b and c> d'
+    response.headers['content-type'] = f"{content_type}; charset=utf-8"
+    response.encoding = 'utf-8'
+    action_objects['session'].get.return_value = response
+    actions.GetText(action_objects, 'foo', exo_url.ExoUrl('https://www.example.com'))
+    query, params = cursor.execute.call_args[0]
+    assert query.startswith('CALL insert_content_SP(')
+    assert params[4] == expected
+
+
+def test_actions_decode_content():
+    def make_response(body: bytes, content_type: str) -> requests.Response:
+        response = requests.Response()
+        response._content = body
+        response.headers['content-type'] = content_type
+        # as requests.adapters.HTTPAdapter.build_response does:
+        response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers)
+        return response
+    # text/html without charset: requests assumes ISO-8859-1,
+    # but UTF-8 is tried first
+    response = make_response('Grüße'.encode('utf-8'), 'text/html')
+    assert response.encoding == 'ISO-8859-1'
+    assert actions.GetContent.decode_content(response) == 'Grüße'
+    # Other types without charset: UTF-8 without detection
+    response = make_response('Grüße'.encode('utf-8'), 'application/xml')
+    with patch.object(requests.Response, 'apparent_encoding',
+                      new_callable=PropertyMock) as detection:
+        assert actions.GetContent.decode_content(response) == 'Grüße'
+        detection.assert_not_called()
+    # Stated charset is used
+    response = make_response('Grüße'.encode('latin-1'),
+                             'text/html; charset=ISO-8859-1')
+    assert actions.GetContent.decode_content(response) == 'Grüße'
+    # No charset and not UTF-8: fall back to what requests does
+    response = make_response('Grüße'.encode('latin-1'), 'text/html')
+    assert actions.GetContent.decode_content(response) == 'Grüße'
+
 # #############################################################################
 # ExoUrl class
 # #############################################################################
@@ -124,6 +291,11 @@ def test_exo_url_DUNDERS():
     myUrl = exo_url.ExoUrl(url_str)
     assert str(myUrl) == url_str
 
+
+def test_exo_url_HOSTNAME():
+    assert exo_url.ExoUrl('https://www.example.com/a;b?c=d').hostname == 'www.example.com'
+    assert exo_url.ExoUrl('https://WWW.Example.com:8080/').hostname == 'www.example.com'
+
 # #############################################################################
 # HELPER FUNCTIONS
 # #############################################################################
@@ -135,11 +307,25 @@ def test_prettify_html():
     # slightly with newer version of beautiful soup.
     broken_html = "<a href='https://www.example.com'>example</b></b><p></p>"
     assert helpers.prettify_html(broken_html) != broken_html
+    # A document without any element must not raise
+    assert helpers.prettify_html('<!-- only a comment -->').strip() == '<!-- only a comment -->'
 
 
 def test_strip_code():
     text_with_html = '<h1>Example</h1> foo'
     assert helpers.strip_code(text_with_html) == 'Example foo'
+    # XHTML with an encoding declaration
+    xhtml = '<?xml version="1.0" encoding="utf-8"?><html><body><p>&auml;</p></body></html>'
+    assert helpers.strip_code(xhtml) == 'ä'
+    assert helpers.strip_code('') == ''
+    assert helpers.strip_code('   ') == ''
+    # Documents without any element (lxml: "Document is empty")
+    assert helpers.strip_code('<!-- only a comment -->') == ''
+    assert helpers.strip_code('<?xml version="1.0"?>') == ''
+    # The content of script, style and template elements is no text
+    page = ('<head><style>p{color:red}</style><script>var x=1;</script></head>'
+            '<body><p>Hi</p><template><p>Later</p></template></body>')
+    assert helpers.strip_code(page) == 'Hi'
 
 # #############################################################################
 # FileManager Class
@@ -177,10 +363,237 @@ def test_FileManager_target_directory(fs):
     assert file_manager.FileManager._FileManager__check_target_directory(None)
     assert file_manager.FileManager._FileManager__check_target_directory(' ')
 
+def test_FileManager_write_response_to_file(fs):
+    fs.create_dir('/downloads')
+    my_fm = file_manager.FileManager(MagicMock(), '/downloads', 'EXO_')
+    content = b'x' * (3 * my_fm.CHUNK_SIZE + 17)
+    response = requests.Response()
+    response.raw = io.BytesIO(content)
+    file_path, hash_value, file_size = my_fm.write_response_to_file(
+        response, 'example.bin')
+    assert file_path.read_bytes() == content
+    assert file_size == len(content)
+    assert hash_value == hashlib.sha256(content).hexdigest()
+    assert my_fm.get_file_hash_and_size(file_path) == (hash_value, file_size)
+    # Errors while reading are raised as exceptions of requests
+    response = requests.Response()
+    response.raw = MagicMock()
+    response.raw.stream.side_effect = urllib3.exceptions.ProtocolError('reset')
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        my_fm.write_response_to_file(response, 'broken.bin')
+
+# #############################################################################
+# LabelManager Class
+# #############################################################################
+
+def test_LabelManager_assign_labels(mock_db, cursor):
+    my_lm = label_manager.LabelManager(mock_db)
+    url = exo_url.ExoUrl('https://www.example.com')
+    my_lm.assign_labels_to_master(url, {'a', 'b', 'x' * 32})
+    # Missing labels are added. Too long labels are ignored:
+    query, rows = cursor.executemany.call_args[0]
+    assert query.startswith('INSERT IGNORE INTO labels')
+    assert sorted(rows) == [('a', ), ('b', )]
+    # All labels are linked, existing links are skipped:
+    query, params = cursor.execute.call_args[0]
+    assert query.startswith('INSERT INTO labelToMaster (labelID, urlHash)')
+    assert 'NOT EXISTS' in query
+    assert params[0] == params[-1] == url.hash
+    assert sorted(params[1:-1]) == ['a', 'b']
+    # Nothing to do if there is no valid label:
+    cursor.reset_mock()
+    my_lm.assign_labels_to_uuid('uuid', {'x' * 32})
+    cursor.execute.assert_not_called()
+    cursor.executemany.assert_not_called()
+
+
+def test_LabelManager_get_label_ids_CACHE(mock_db, cursor):
+    my_lm = label_manager.LabelManager(mock_db)
+    cursor.fetchall.return_value = (('a', 1), ('b', 2))
+    assert my_lm.get_label_ids({'a', 'b'}) == {1, 2}
+    # Only the unknown label is queried:
+    cursor.fetchall.return_value = (('c', 3), )
+    assert my_lm.get_label_ids({'a', 'c'}) == {1, 3}
+    assert cursor.execute.call_args[0][1] == ('c', )
+    cursor.reset_mock()
+    assert my_lm.get_label_ids('b') == {2}
+    cursor.execute.assert_not_called()
+    # The database ignores case, but only exact matches are cached:
+    cursor.fetchall.return_value = (('a', 1), )
+    assert my_lm.get_label_ids('A') == {1}
+    assert 'A' not in my_lm.label_ids
+
+
 # #############################################################################
 # NotificationManager Class
 # #############################################################################
 
+def test_NotificationManager_NO_MAIL_SETTINGS():
+    stats = MagicMock()
+    stats.get_processed_counter.return_value = 10
+    my_nm = notification_manager.NotificationManager(
+        'Test', None, dict(), MagicMock(), stats, milestone=5)
+    assert my_nm.send_mails is False
+    assert my_nm.send_finish_msg is False
+    # Must neither fail for lack of a mailer nor query the queue:
+    my_nm.send_msg_milestone()
+    my_nm.send_msg_finish()
+    my_nm.send_msg_abort_lost_db()
+    my_nm.send_custom_msg('subject', 'body')
+    stats.queue_stats.assert_not_called()
+
+
+def test_NotificationManager_VALIDATE_BEFORE_SENDING():
+    mail_settings = {'recipient': 'test@example.com',
+                     'sender': 'pytest@example.com'}
+    with patch('bote.Mailer') as mailer:
+        with pytest.raises(ValueError):
+            notification_manager.NotificationManager(
+                'Test', mail_settings,
+                {'send_start_msg': True, 'send_finish_msg': 'yes'},
+                MagicMock(), MagicMock())
+        mailer.return_value.send_mail.assert_not_called()
+        with pytest.raises(ValueError):
+            notification_manager.NotificationManager(
+                'Test', mail_settings, {'send_start_msg': 'no'},
+                MagicMock(), MagicMock())
+        mailer.return_value.send_mail.assert_not_called()
+
+
+def test_NotificationManager_MILESTONE_MIN_INTERVAL():
+    stats = MagicMock()
+    stats.get_processed_counter.return_value = 10
+    stats.queue_stats.return_value = {'tasks_without_error': 5,
+                                      'tasks_with_temp_errors': 1}
+    time_mgr = MagicMock()
+    time_mgr.estimate_remaining_time.return_value = 120
+    my_nm = notification_manager.NotificationManager(
+        'Test', None, {'milestone_min_interval': 600},
+        time_mgr, stats, milestone=5)
+    my_nm.mailer = MagicMock()
+    my_nm.send_mails = True
+    my_nm.send_msg_milestone()
+    my_nm.wait_for_pending_mails()
+    assert my_nm.mailer.send_mail.call_count == 1
+    # Too early for the next message:
+    my_nm.send_msg_milestone()
+    my_nm.send_msg_milestone()
+    assert my_nm.mailer.send_mail.call_count == 1
+    assert stats.queue_stats.call_count == 1
+    # Later the skipped milestones are mentioned:
+    my_nm.last_milestone_msg -= 601
+    my_nm.send_msg_milestone()
+    my_nm.wait_for_pending_mails()
+    assert my_nm.mailer.send_mail.call_count == 2
+    assert '2 milestone(s)' in my_nm.mailer.send_mail.call_args[0][1]
+    assert my_nm.skipped_milestones == 0
+
+
+def test_NotificationManager_GREYLISTING():
+    my_nm = notification_manager.NotificationManager(
+        'Test', None, dict(), MagicMock(), MagicMock())
+    my_nm.mailer = MagicMock()
+    my_nm.send_mails = True
+    greylisted = smtplib.SMTPRecipientsRefused(
+        {'test@example.com': (450, b'Greylisted, retry in 300 seconds')})
+    with patch('exoskeleton.notification_manager.time.sleep') as sleep:
+        # The retry is handed to the background thread ...
+        my_nm.mailer.send_mail.side_effect = [greylisted, None]
+        my_nm._NotificationManager__send('subject', 'body')
+        # ... and is not lost when the bot stops:
+        my_nm.wait_for_pending_mails()
+        sleep.assert_called_once_with(300)
+        assert my_nm.mailer.send_mail.call_count == 2
+        # No interval stated: use the default. A mail that is already sent
+        # in the background waits there for its retry.
+        sleep.reset_mock()
+        my_nm.mailer.send_mail.side_effect = [
+            smtplib.SMTPDataError(451, 'Try again later'), None]
+        my_nm.send_custom_msg('subject', 'body')
+        my_nm.wait_for_pending_mails()
+        sleep.assert_called_once_with(my_nm.DEFAULT_RETRY_SECONDS)
+    # Permanent errors are raised as before
+    my_nm.mailer.send_mail.side_effect = smtplib.SMTPDataError(
+        550, 'No such user')
+    with pytest.raises(smtplib.SMTPDataError):
+        my_nm._NotificationManager__send('subject', 'body')
+
+
+def test_NotificationManager_SEND_IN_BACKGROUND():
+    my_nm = notification_manager.NotificationManager(
+        'Test', None, dict(), MagicMock(), MagicMock())
+    my_nm.mailer = MagicMock()
+    my_nm.send_mails = True
+    my_nm.mailer.send_mail.side_effect = smtplib.SMTPDataError(
+        550, 'No such user')
+    # Errors in the worker thread are logged, not raised:
+    my_nm.send_custom_msg('first', 'body')
+    my_nm.send_custom_msg('second', 'body')
+    my_nm.wait_for_pending_mails()
+    subjects = [c[0][0] for c in my_nm.mailer.send_mail.call_args_list]
+    assert subjects == ['first', 'second']
+
+
+# #############################################################################
+# QueueManager Class
+# #############################################################################
+
+
+def test_QueueManager_HASH_IN_PYTHON(mock_db, cursor):
+    cursor.fetchone.return_value = ('42', )
+    my_qm = queue_manager.QueueManager(
+        mock_db, MagicMock(), MagicMock(), MagicMock(), MagicMock(),
+        MagicMock(), MagicMock(), dict())
+    url = exo_url.ExoUrl('https://www.example.com')
+    assert my_qm.get_filemaster_id_by_url(url) == '42'
+    query, params = cursor.execute.call_args[0]
+    assert 'SHA2' not in query
+    assert params == (url.hash, )
+
+
+def test_QueueManager_add_to_queue_PRECHECK(mock_db, cursor):
+    my_qm = queue_manager.QueueManager(
+        mock_db, MagicMock(), MagicMock(), MagicMock(), MagicMock(),
+        MagicMock(), MagicMock(), dict())
+    url = exo_url.ExoUrl('https://www.example.com')
+    precheck = call(queue_manager.QueueManager.ADD_PRECHECK_QUERY,
+                    ('www.example.com', 1, url.hash, 1, url.hash))
+    # Host on blocklist
+    cursor.fetchone.return_value = (1, None, 0, 0)
+    with pytest.raises(err.HostOnBlocklistError):
+        my_qm.add_to_queue(url, 1)
+    assert cursor.execute.call_args == precheck
+    # Same task already in queue: nothing is added
+    cursor.reset_mock()
+    cursor.fetchone.return_value = (0, None, 0, 1)
+    assert my_qm.add_to_queue(url, 1) is None
+    assert cursor.execute.call_args_list == [precheck]
+    # Already processed the same way: nothing is added
+    cursor.reset_mock()
+    cursor.fetchone.return_value = (0, 5, 1, 0)
+    assert my_qm.add_to_queue(url, 1) is None
+    assert cursor.execute.call_args_list == [precheck]
+    # Processed, but with another action: added
+    cursor.reset_mock()
+    cursor.fetchone.return_value = (0, 5, 0, 0)
+    uuid_value = my_qm.add_to_queue(url, 1, prettify_html=True)
+    assert cursor.execute.call_args_list == [
+        precheck,
+        call('CALL add_to_queue_SP(%s, %s, %s, %s, %s);',
+             (uuid_value, 1, url, 'www.example.com', True))]
+
+
+def test_QueueManager_get_next_task(mock_db, cursor):
+    my_qm = queue_manager.QueueManager(
+        mock_db, MagicMock(), MagicMock(), MagicMock(), MagicMock(),
+        MagicMock(), MagicMock(), dict())
+    task = ('id0', 1, 'https://www.example.com', 'hash', 0)
+    cursor.fetchone.return_value = task
+    assert my_qm.get_next_task() == task
+    # Several bots can share the queue, so every task is selected
+    # by the database right before it is processed:
+    cursor.execute.assert_called_once_with('CALL next_queue_object_SP();')
+
 
 # #############################################################################
 # RemoteControlChrome Class
@@ -206,6 +619,22 @@ def test_RemoteControlChrome_functions():
     with pytest.raises(ValueError):
         my_chrome.page_to_pdf('https://www.example.com', './', '12343454')
 
+# #############################################################################
+# StatisticsManager Class
+# #############################################################################
+
+def test_StatisticsManager_queue_stats(mock_db, cursor):
+    # SUM() returns a DECIMAL
+    cursor.fetchone.return_value = (5, Decimal(2), Decimal(1), Decimal(3))
+    my_sm = statistics_manager.StatisticsManager(mock_db)
+    assert my_sm.queue_stats() == {'tasks_without_error': 5,
+                                   'tasks_with_temp_errors': 2,
+                                   'tasks_with_permanent_errors': 1,
+                                   'tasks_blocked_by_rate_limit': 3}
+    cursor.execute.assert_called_once_with(
+        statistics_manager.StatisticsManager.QUEUE_STATS_QUERY)
+
+
 # #############################################################################
 # TimeManager Class
 # #############################################################################
@@ -222,6 +651,13 @@ def test_TimeManager():
     # non numeric value for wait_max
     with pytest.raises(ValueError):
         time_manager.TimeManager(10, 'abc')
+    # bool is a subclass of int, but no number of seconds
+    with pytest.raises(ValueError):
+        time_manager.TimeManager(True, 40)
+    # Subclasses of int are accepted
+    class Seconds(int):
+        pass
+    time_manager.TimeManager(Seconds(10), 40)
     # Contradiction: wait_min > wait_max
     with pytest.raises(ValueError):
         time_manager.TimeManager(100, 10)
@@ -251,3 +687,9 @@ def test_TimeManager_functions():
     # random-wait needs to be patched
     with patch('time.sleep', return_value=None):
         my_tm.random_wait()
+    # wait times that are no whole seconds
+    float_tm = time_manager.TimeManager(0.5, 1.5)
+    with patch('time.sleep', return_value=None) as mock_sleep:
+        float_tm.random_wait()
+        query_delay = mock_sleep.call_args[0][0]
+        assert 0.5 <= query_delay <= 1.5